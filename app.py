@@ -1,38 +1,275 @@
 import streamlit as st
 import pandas as pd
 import io
-from datetime import datetime
+from datetime import datetime, date
 import os
 from zoneinfo import ZoneInfo
 import numpy as np
+import warnings
+import importlib.util
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-def find_header_and_read_excel(uploaded_file, sheet_name, keywords):
+# Copy-on-Writeを有効にし、抽出結果を変更する際の防御的な.copy()を不要にする（変更時にのみ複製される）
+pd.set_option('mode.copy_on_write', True)
+
+# 日付列の解析で試す書式（Excelの日付セルは文字列化すると先頭の書式になる）
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%Y/%m/%d', '%Y%m%d', '%Y年%m月%d日')
+
+# ヘッダー行を探す際に最初に読み込む行数。見つからない場合のみシート全体を読む
+HEADER_SEARCH_ROWS = 50
+
+# Excelの読込エンジン。Rust製のcalamine(python-calamine)が使えれば優先し、なければpandasの自動選択に任せる
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else None
+
+# サマリーの表示順 (表示名, 集計キー, 単位)。Excel出力と画面表示で共通に使う
+# 退職者候補は退職者データの有無で集計キーが変わるが、集計結果にはどちらか一方しか入らない
+SUMMARY_ORDER = (
+    ('前期従業員データ数', '前期従業員データ数', '人'), ('当期従業員データ数', '当期従業員データ数', '人'),
+    ('当期退職者データ数', '当期退職者データ数', '人'), ('キー重複', 'キー重複', '件'),
+    ('基本情報変更エラー', '基本情報変更エラー', '件'), ('日付妥当性エラー', '日付妥当性エラー', '件'),
+    ('在籍者数（凸合）', '在籍者数', '人'),
+    ('退職者候補（不凸合＝前期のみ）', '退職者候補（不突合）', '人'), ('退職者候補（不凸合＝前期のみ）', '退職者候補', '人'),
+    ('入社者候補（不凸合＝当期のみ）', '入社者候補', '人'),
+    ('退職者データ過剰（不凸合＝前期なし）', '退職者データ過剰', '人'),
+    ('マッチした退職者（凸合）', 'マッチした退職者', '人'),
+    ('給与減額エラー(1)', '給与減額エラー(1)', '件'), ('給与増加率エラー(1)', '給与増加率エラー(1)', '件'),
+    ('累計給与エラー(1-1)', '累計給与エラー(1-1)', '件'), ('累計給与エラー(1-2)', '累計給与エラー(1-2)', '件'),
+    ('給与減額エラー(3)', '給与減額エラー(3)', '件'), ('給与増加率エラー(3)', '給与増加率エラー(3)', '件'),
+    ('累計給与エラー(3-1)', '累計給与エラー(3-1)', '件'), ('累計給与エラー(3-2)', '累計給与エラー(3-2)', '件'),
+)
+
+def build_column_names(header_row):
     """
-    Excelファイルからキーワードを含む行をヘッダーとして特定し、データを読み込む関数。
+    ヘッダー行の値から列名リストを作成する関数。
+    空欄は 'Unnamed: n'、重複は '.1', '.2' を付与し、pd.read_excel(header=n) と同じ命名にそろえる。
+    """
+    columns, seen = [], {}
+    for i, value in enumerate(header_row):
+        name = f"Unnamed: {i}" if pd.isna(value) else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+def find_header_row_index(df_no_header, keywords):
+    """
+    すべてのキーワードを含む最初の行の位置を返す関数。見つからない場合は -1 を返す。
+    """
+    if df_no_header.empty:
+        return -1
+    # 行ごとのループを避け、列単位の文字列結合とstr.containsで一括判定する
+    cells = df_no_header.astype(str).where(df_no_header.notna(), '')
+    row_str = cells.iloc[:, 0]
+    for col in cells.columns[1:]:
+        row_str = row_str + cells[col]
+    mask = np.ones(len(row_str), dtype=bool)
+    for keyword in keywords:
+        mask &= row_str.str.contains(keyword, regex=False).to_numpy()
+    return int(np.argmax(mask)) if mask.any() else -1
+
+def detect_datetime_format(values, sample_size=100):
+    """
+    先頭のサンプル値をすべて解析できる日付書式を返す関数。該当する書式がない場合は None を返す。
+    """
+    sample = values[:sample_size]
+    for fmt in DATE_FORMATS:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def yyyymmdd_to_datetime(series):
+    """
+    YYYYMMDD形式の数値列を日付形式に変換する関数。文字列化・文字列解析を経ずに整数演算で年月日に分解する。
+    """
+    values = pd.to_numeric(series, errors='coerce')
+    parts = pd.DataFrame({'year': values // 10000, 'month': values // 100 % 100, 'day': values % 100})
+    return pd.Series(pd.to_datetime(parts, errors='coerce'), index=series.index, name=series.name)
+
+def convert_to_datetime(series):
+    """
+    列を日付形式に変換する関数。
+    日付列は同じ値の重複が多いため、ユニーク値だけを解析して各行に展開する。
+    """
+    # Excelの日付セルのみの列は読込時点で日付型になっているため、文字列化・再解析をせずそのまま使う
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return yyyymmdd_to_datetime(series)
+    codes, uniques = pd.factorize(series)
+    strings = pd.Index(uniques).astype(str)
+    # 書式を明示して要素ごとのdateutil解析を避ける。判定できない場合のみ混在書式として解析する
+    fmt = detect_datetime_format(strings)
+    if fmt:
+        parsed = pd.to_datetime(strings, format=fmt, errors='coerce')
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            parsed = pd.to_datetime(strings, format='mixed', errors='coerce')
+    # 欠損値(codes == -1)は末尾に追加したNaTを参照させる
+    values = np.append(parsed.to_numpy(), np.datetime64('NaT'))
+    return pd.Series(values[codes], index=series.index, name=series.name)
+
+def to_yyyymmdd(series):
+    """
+    日付列をYYYYMMDD形式の整数(int64)に変換する関数。NaTは0とする。
+    """
+    return (series.dt.year * 10000 + series.dt.month * 100 + series.dt.day).fillna(0).astype('int64')
+
+def categorize_repeated_strings(df, exclude_cols, max_unique_ratio=0.5):
+    """
+    所属・役職など同じ値の繰り返しが多い文字列列をカテゴリ型に変換する関数。
+    結合で前期・当期の列が複製される際のメモリを抑える。チェックに使う列(exclude_cols)は変換しない。
+    """
+    for col in df.columns:
+        if col not in exclude_cols and df[col].dtype == object and df[col].nunique() < len(df) * max_unique_ratio:
+            df[col] = df[col].astype('category')
+    return df
+
+def get_file_digest(uploaded_file):
+    """
+    アップロードファイルの内容のハッシュ値を返す関数。
+    アップロードごとに一度だけ計算し、session_stateに保持して再実行時の再計算を避ける。
+    """
+    digests = st.session_state.setdefault('file_digests', {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+    return digests[uploaded_file.file_id]
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def read_sheet_names(_file_bytes, file_digest):
+    """
+    Excelファイルの内容(bytes)からシート名の一覧を返す関数。
+    サイドバーのシート選択は再実行のたびに描画されるため、ファイルのハッシュ値をキーに結果をキャッシュする。
+    """
+    with pd.ExcelFile(io.BytesIO(_file_bytes), engine=EXCEL_ENGINE) as xls:
+        return xls.sheet_names
+
+def get_sheet_names(uploaded_file):
+    """
+    アップロードファイルのシート名一覧を返す関数。
+    """
+    return read_sheet_names(uploaded_file.getvalue(), get_file_digest(uploaded_file))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def read_excel_with_header(_file_bytes, file_digest, sheet_name, keywords):
+    """
+    Excelファイルの内容(bytes)からキーワードを含む行をヘッダーとして特定し、データを読み込む関数。
+    ウィジェット操作のたびに再実行されるため、ファイルのハッシュ値・シート名・キーワードをキーに結果をキャッシュする。
+    (_file_bytes は先頭の _ によりキャッシュキーの計算対象外とし、毎回の全バイトのハッシュ計算を避ける)
+    戻り値は (DataFrame, エラーメッセージ) で、いずれか一方が None となる。
     """
-    if uploaded_file:
-        uploaded_file.seek(0)
     try:
-        # .xlsと.xlsxの両方に対応するため、engineを自動選択させる
-        df_no_header = pd.read_excel(uploaded_file, sheet_name=sheet_name, header=None, engine=None)
-        header_row_index = -1
-        for i, row in df_no_header.iterrows():
-            row_str = ''.join(map(str, row.dropna().values))
-            if all(keyword in row_str for keyword in keywords):
-                header_row_index = i
-                break
-        
+        # calamineは.xlsと.xlsxの両方に対応する。未インストール時はengineを自動選択させる
+        # 開いたブックを使い回し、シートの存在確認と読込でファイルを再解析しない
+        with pd.ExcelFile(io.BytesIO(_file_bytes), engine=EXCEL_ENGINE) as xls:
+            if sheet_name not in xls.sheet_names:
+                return None, f"シート '{sheet_name}' が見つかりませんでした。(シート一覧: {xls.sheet_names})"
+            # ヘッダー行はほぼ先頭付近にあるため、まず先頭行だけを読んで探し、見つかればその行をヘッダーとして読み込む
+            df_head = xls.parse(sheet_name, header=None, nrows=HEADER_SEARCH_ROWS)
+            header_row_index = find_header_row_index(df_head, keywords)
+            if header_row_index != -1:
+                return xls.parse(sheet_name, header=header_row_index), None
+            if len(df_head) < HEADER_SEARCH_ROWS:
+                return None, f"シート '{sheet_name}' でヘッダー行(キーワード: {list(keywords)})が見つかりませんでした。"
+            df_no_header = xls.parse(sheet_name, header=None)
+        header_row_index = find_header_row_index(df_no_header, keywords)
         if header_row_index == -1:
-            st.error(f"ファイル '{uploaded_file.name}' のシート '{sheet_name}' でヘッダー行(キーワード: {keywords})が見つかりませんでした。")
-            return None
-        
-        uploaded_file.seek(0)
-        df = pd.read_excel(uploaded_file, sheet_name=sheet_name, header=header_row_index, engine=None)
-        return df
+            return None, f"シート '{sheet_name}' でヘッダー行(キーワード: {list(keywords)})が見つかりませんでした。"
+
+        # 読み込み済みのデータからヘッダー行以降を切り出す（Excelの再解析を避ける）
+        df = df_no_header.iloc[header_row_index + 1:].reset_index(drop=True)
+        df.columns = build_column_names(df_no_header.iloc[header_row_index])
+        # header=None で読むと全列がobject型になるため、列ごとの型を推論し直す
+        return df.infer_objects(), None
 
     except Exception as e:
-        st.error(f"ファイル '{uploaded_file.name}' のシート '{sheet_name}' 読込中にエラー: {e}")
-        return None
+        return None, f"シート '{sheet_name}' 読込中にエラー: {e}"
+
+def read_excel_files(targets):
+    """
+    複数のExcelファイルを並行して読み込む関数。
+    targets は (uploaded_file, sheet_name, keywords) のリストで、ファイルまたはシート名が未指定の要素は None を返す。
+    解析はワーカースレッドで並行させ、session_stateの参照とエラー表示はメインスレッドで行う。
+    """
+    jobs = {i: (f.getvalue(), get_file_digest(f), sheet, tuple(keywords)) for i, (f, sheet, keywords) in enumerate(targets) if f and sheet}
+    if not jobs:
+        return [None] * len(targets)
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=len(jobs), initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        futures = {i: executor.submit(read_excel_with_header, *args) for i, args in jobs.items()}
+        outcomes = {i: future.result() for i, future in futures.items()}
+
+    dataframes = []
+    for i, (uploaded_file, _, _) in enumerate(targets):
+        df, error = outcomes.get(i, (None, None))
+        if error:
+            st.error(f"ファイル '{uploaded_file.name}' の{error}")
+        dataframes.append(df)
+    return dataframes
+
+def invalid_age_mask(df, date_col, birth_col):
+    """
+    入社・加入時の年齢が15歳未満または90歳以上の行を示すマスクを返す関数。
+    どちらかの日付が欠損している行は差がNaTとなり、比較結果がFalseになるため除外される。
+    """
+    elapsed = df[date_col].to_numpy() - df[birth_col].to_numpy()
+    # 年齢や日数(浮動小数点)に換算せず、timedelta64のまま整数の閾値と比較する
+    # (経過日数の切り捨て値を15年・90年 = 365.25日/年と比較するのと同じ結果になるよう、閾値は日数の切り上げとする)
+    min_days, max_days = int(np.ceil(15 * 365.25)), int(np.ceil(90 * 365.25))
+    return (elapsed < np.timedelta64(min_days, 'D')) | (elapsed >= np.timedelta64(max_days, 'D'))
+
+def find_header_and_read_excel(uploaded_file, sheet_name, keywords):
+    """
+    Excelファイルからキーワードを含む行をヘッダーとして特定し、データを読み込む関数。
+    """
+    df, error = read_excel_with_header(uploaded_file.getvalue(), get_file_digest(uploaded_file), sheet_name, tuple(keywords))
+    if error:
+        st.error(f"ファイル '{uploaded_file.name}' の{error}")
+    return df
+
+def create_sheet_formats(workbook):
+    """
+    結果シートで共通に使うセル書式(ヘッダー・日付)を作成する関数。
+    シートごとに作らず、ブック全体で同じ書式オブジェクトを使い回す。
+    """
+    return {
+        'header': workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}),
+        'date': workbook.add_format({'num_format': 'yyyy/mm/dd'}),
+    }
+
+def write_dataframe_to_sheet(writer, sheet_name, df, formats, date_col_width=12):
+    """
+    DataFrameをxlsxwriterのワークシートへ値のみ直接書き込む関数。
+    to_excelのセルごとの書式処理を経由せず、日付値のセルだけに日付書式を、日付型の列に列幅を設定する。
+    formats は create_sheet_formats で作成した書式の辞書。
+    """
+    worksheet = writer.book.add_worksheet(sheet_name)
+    date_format = formats['date']
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], formats['header'])
+
+    # 列を取り出さずdtypesだけで日付列を判定し、日付列がないシートでは何もしない
+    cell_formats = [None] * len(df.columns)
+    for idx, dtype in enumerate(df.dtypes):
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            cell_formats[idx] = date_format
+            worksheet.set_column(idx, idx, date_col_width)
+
+    # 欠損値(NaN/NaT)はNoneにして空セルのままにする
+    # 日付と文字列が混在する列(object型・カテゴリ型)の日付値も日付書式で出力する（書式なしではシリアル値で表示されるため）
+    values = df.astype(object).where(df.notna(), None).to_numpy()
+    for row_idx, row in enumerate(values, start=1):
+        for col_idx, value in enumerate(row):
+            if value is not None:
+                cell_format = date_format if isinstance(value, (datetime, date, pd.Timestamp)) else cell_formats[col_idx]
+                worksheet.write(row_idx, col_idx, value, cell_format)
 
 def main():
     """
@@ -65,7 +302,7 @@ def main():
         st.markdown("###### シート名")
         if file_prev:
             try:
-                sheets = pd.ExcelFile(file_prev).sheet_names
+                sheets = get_sheet_names(file_prev)
                 default_sheet = "従業員データフォーマット"
                 index = sheets.index(default_sheet) if default_sheet in sheets else 0
                 sheet_prev = st.selectbox("シートを選択", options=sheets, index=index, key="sheet_prev", label_visibility="collapsed")
@@ -83,7 +320,7 @@ def main():
         st.markdown("###### シート名")
         if file_curr:
             try:
-                sheets = pd.ExcelFile(file_curr).sheet_names
+                sheets = get_sheet_names(file_curr)
                 default_sheet = "従業員データフォーマット"
                 index = sheets.index(default_sheet) if default_sheet in sheets else 0
                 sheet_curr = st.selectbox("シートを選択", options=sheets, index=index, key="sheet_curr", label_visibility="collapsed")
@@ -101,12 +338,9 @@ def main():
     with st.expander("列名設定を展開/折りたたみ", expanded=True):
         NONE_OPTION = "(選択しない)"
         columns_prev, columns_curr, columns_retire = [], [], []
-        if file_prev and sheet_prev:
-            df_cols = find_header_and_read_excel(file_prev, sheet_prev, keywords=keywords_prev)
-            if df_cols is not None: columns_prev = df_cols.columns.tolist()
-        if file_curr and sheet_curr:
-            df_cols = find_header_and_read_excel(file_curr, sheet_curr, keywords=keywords_curr)
-            if df_cols is not None: columns_curr = df_cols.columns.tolist()
+        df_cols_prev, df_cols_curr = read_excel_files([(file_prev, sheet_prev, keywords_prev), (file_curr, sheet_curr, keywords_curr)])
+        if df_cols_prev is not None: columns_prev = df_cols_prev.columns.tolist()
+        if df_cols_curr is not None: columns_curr = df_cols_curr.columns.tolist()
         
         def create_column_selector(label, default_name, columns, key, disabled=False):
             if columns:
@@ -158,7 +392,7 @@ def main():
             st.markdown("###### シート名")
             if file_retire:
                 try:
-                    sheets = pd.ExcelFile(file_retire).sheet_names
+                    sheets = get_sheet_names(file_retire)
                     default_sheet = "退職者データフォーマット"
                     index = sheets.index(default_sheet) if default_sheet in sheets else 0
                     sheet_retire = st.selectbox("シートを選択", options=sheets, index=index, key="sheet_retire", label_visibility="collapsed", disabled=not retire_file_is_used)
@@ -247,7 +481,9 @@ def main():
                         return df.rename(columns=rename_map)
 
                     st.info("ステップ1/7: Excelファイルを読み込み、列名を標準化しています...")
-                    df_prev = find_header_and_read_excel(file_prev, sheet_prev, keywords=keywords_prev); df_curr = find_header_and_read_excel(file_curr, sheet_curr, keywords=keywords_curr); df_retire = None
+                    # 退職者データを使う場合は前期末・当期末と並行して読み込む
+                    retire_target = (file_retire, sheet_retire, keywords_retire) if retire_file_is_used else (None, None, [])
+                    df_prev, df_curr, df_retire_read = read_excel_files([(file_prev, sheet_prev, keywords_prev), (file_curr, sheet_curr, keywords_curr), retire_target]); df_retire = None
                     if df_prev is None or df_curr is None:
                         st.error("🚫 **処理停止: 必須ファイルが読み込めませんでした。**", icon="🚨"); st.warning("ファイル設定やヘッダーキーワードが正しいか確認してください。"); st.stop()
                     
@@ -256,11 +492,10 @@ def main():
                     if col_retire_date_curr != NONE_OPTION and INTERNAL_COLS["retire_date"] in df_curr.columns:
                         st.info(f"ステップ1.5/7: 当期末データから退職者を抽出...")
                         retiree_mask = df_curr[INTERNAL_COLS["retire_date"]].notna()
-                        df_retire = df_curr[retiree_mask].copy(); df_curr = df_curr[~retiree_mask].copy()
+                        df_retire = df_curr[retiree_mask]; df_curr = df_curr[~retiree_mask]
                         if not df_retire.empty: st.success(f"{len(df_retire)}名の退職者を当期末データから抽出し、在籍者から除外しました。")
-                    elif file_retire:
-                        df_retire = find_header_and_read_excel(file_retire, sheet_retire, keywords=keywords_retire)
-                        if df_retire is not None: df_retire = rename_df_columns(df_retire, selections_retire)
+                    elif df_retire_read is not None:
+                        df_retire = rename_df_columns(df_retire_read, selections_retire)
 
                     # --- [修正点 1] ---
                     # 加入年月日を独立してチェックするため、ここでのマージ処理を削除
@@ -270,7 +505,8 @@ def main():
                         if df is not None:
                             for col in date_cols_to_convert:
                                 if col in df.columns:
-                                    df[col] = pd.to_datetime(df[col].astype(str), errors='coerce')
+                                    df[col] = convert_to_datetime(df[col])
+                            categorize_repeated_strings(df, set(INTERNAL_COLS.values()))
 
                     # --- [修正点 2] ---
                     # マッチングキー生成ロジックを修正
@@ -298,14 +534,23 @@ def main():
                             else:
                                 key_date = df[enroll_date_col]
 
-                            df[key_col_name] = key_date.dt.strftime('%Y%m%d').fillna('NODATE') + '_' + df[birth_date_col].dt.strftime('%Y%m%d').fillna('NODATE')
+                            # YYYYMMDD(入社/加入) × 10^8 + YYYYMMDD(生年月日) のint64キー。日付なしは0として扱う
+                            df[key_col_name] = to_yyyymmdd(key_date) * 100_000_000 + to_yyyymmdd(df[birth_date_col])
                         else: 
-                            df[key_col_name] = df[INTERNAL_COLS["emp_id"]].astype(str)
+                            # 従業員番号はArrow文字列として保持する(欠損は従来どおり 'nan' として扱う)
+                            df[key_col_name] = df[INTERNAL_COLS["emp_id"]].astype('string[pyarrow]').fillna('nan')
+                    # 全データで共通のカテゴリ型にそろえ、以降の結合・照合を文字列ではなく整数コードで行う
+                    # カテゴリはキーの値順に並べ、キー重複シートの並び(カテゴリ順でのソート)をキーの値順に保つ
+                    key_dtype = pd.CategoricalDtype(pd.Index(pd.unique(pd.concat([df[key_col_name] for df in dataframes.values()], ignore_index=True))).sort_values())
+                    for df in dataframes.values():
+                        df[key_col_name] = df[key_col_name].astype(key_dtype)
                     key_type = "従業員番号" if use_emp_id_key else "入社年月日/加入年月日 + 生年月日"; st.success(f"マッチングキーとして '{key_type}' を使用します。")
                     
                     results = {}; st.info("ステップ3/7: 基本エラーチェック...")
                     for name, df in dataframes.items():
-                        duplicates = df[df[key_col_name].duplicated(keep=False)]; results[f'キー重複_{name}'] = duplicates.sort_values(by=key_col_name)
+                        # キーはカテゴリ型のため、コードの出現回数(bincount)から重複行を判定しハッシュ計算を省く
+                        key_codes = df[key_col_name].cat.codes.to_numpy(); key_counts = np.bincount(key_codes[key_codes >= 0], minlength=len(key_dtype.categories))
+                        duplicates = df[(key_codes >= 0) & (key_counts[key_codes] > 1)]; results[f'キー重複_{name}'] = duplicates.sort_values(by=key_col_name, kind='stable')
                     
                     # --- [修正点 3] ---
                     # 加入年月日のエラーチェックを追加
@@ -317,14 +562,11 @@ def main():
                         if INTERNAL_COLS["hire_date"] in df.columns:
                             # 入社時年齢
                             if INTERNAL_COLS["birth_date"] in df.columns:
-                                df_copy = df.copy(); valid_dates = df_copy.dropna(subset=[INTERNAL_COLS["hire_date"], INTERNAL_COLS["birth_date"]])
-                                if not valid_dates.empty:
-                                    age = (valid_dates[INTERNAL_COLS["hire_date"]] - valid_dates[INTERNAL_COLS["birth_date"]]).dt.days / 365.25
-                                    invalid_age_df = df.loc[valid_dates[(age < 15) | (age >= 90)].index].copy()
-                                    if not invalid_age_df.empty:
-                                        invalid_age_df['エラー理由'] = '入社時年齢が15歳未満または90歳以上'; temp_errors.append(invalid_age_df)
+                                invalid_age_df = df[invalid_age_mask(df, INTERNAL_COLS["hire_date"], INTERNAL_COLS["birth_date"])]
+                                if not invalid_age_df.empty:
+                                    invalid_age_df['エラー理由'] = '入社時年齢が15歳未満または90歳以上'; temp_errors.append(invalid_age_df)
                             # 未来の入社日
-                            invalid_hire_date_df = df[df[INTERNAL_COLS["hire_date"]] > relevant_date].copy()
+                            invalid_hire_date_df = df[df[INTERNAL_COLS["hire_date"]] > relevant_date]
                             if not invalid_hire_date_df.empty:
                                  invalid_hire_date_df['エラー理由'] = f'入社日が{date_type}({relevant_date.date()})より後'; temp_errors.append(invalid_hire_date_df)
 
@@ -332,14 +574,11 @@ def main():
                         if INTERNAL_COLS["enroll_date"] in df.columns:
                             # 加入時年齢
                             if INTERNAL_COLS["birth_date"] in df.columns:
-                                df_copy = df.copy(); valid_dates = df_copy.dropna(subset=[INTERNAL_COLS["enroll_date"], INTERNAL_COLS["birth_date"]])
-                                if not valid_dates.empty:
-                                    age = (valid_dates[INTERNAL_COLS["enroll_date"]] - valid_dates[INTERNAL_COLS["birth_date"]]).dt.days / 365.25
-                                    invalid_age_df = df.loc[valid_dates[(age < 15) | (age >= 90)].index].copy()
-                                    if not invalid_age_df.empty:
-                                        invalid_age_df['エラー理由'] = '加入時年齢が15歳未満または90歳以上'; temp_errors.append(invalid_age_df)
+                                invalid_age_df = df[invalid_age_mask(df, INTERNAL_COLS["enroll_date"], INTERNAL_COLS["birth_date"])]
+                                if not invalid_age_df.empty:
+                                    invalid_age_df['エラー理由'] = '加入時年齢が15歳未満または90歳以上'; temp_errors.append(invalid_age_df)
                             # 未来の加入日
-                            invalid_enroll_date_df = df[df[INTERNAL_COLS["enroll_date"]] > relevant_date].copy()
+                            invalid_enroll_date_df = df[df[INTERNAL_COLS["enroll_date"]] > relevant_date]
                             if not invalid_enroll_date_df.empty:
                                 invalid_enroll_date_df['エラー理由'] = f'加入日が{date_type}({relevant_date.date()})より後'; temp_errors.append(invalid_enroll_date_df)
 
@@ -348,17 +587,22 @@ def main():
                     
                     if df_retire is not None and INTERNAL_COLS["retire_date"] in df_retire.columns:
                         temp_errors_retire = []
-                        invalid_retire1 = df_retire[df_retire[INTERNAL_COLS["retire_date"]] <= prev_period_end_date_ts].copy()
+                        invalid_retire1 = df_retire[df_retire[INTERNAL_COLS["retire_date"]] <= prev_period_end_date_ts]
                         if not invalid_retire1.empty:
                             invalid_retire1['エラー理由'] = f'退職日が前期末日({prev_period_end_date_ts.date()})以前'; temp_errors_retire.append(invalid_retire1)
-                        invalid_retire2 = df_retire[df_retire[INTERNAL_COLS["retire_date"]] > base_date_ts].copy()
+                        invalid_retire2 = df_retire[df_retire[INTERNAL_COLS["retire_date"]] > base_date_ts]
                         if not invalid_retire2.empty:
                             invalid_retire2['エラー理由'] = f'退職日が計算基準日({base_date_ts.date()})より後'; temp_errors_retire.append(invalid_retire2)
                         if temp_errors_retire:
                             results['日付妥当性エラー_退職者'] = pd.concat(temp_errors_retire).drop_duplicates(subset=[key_col_name])
                     
-                    st.info("ステップ4/7: 在籍者・退職者・入社者の照合..."); merged_st = pd.merge(df_prev, df_curr, on=key_col_name, how='outer', suffixes=('_前期', '_当期'), indicator=True)
-                    retiree_candidates = merged_st[merged_st['_merge'] == 'left_only'].copy(); new_hires = merged_st[merged_st['_merge'] == 'right_only'].copy(); continuing_employees = merged_st[merged_st['_merge'] == 'both'].copy()
+                    st.info("ステップ4/7: 在籍者・退職者・入社者の照合...")
+                    # 片側のみのデータはキーの集合演算で元データから直接抽出し、結合は両期にいる在籍者だけに行う
+                    # (出力シートの行順は従来の外部結合と同じくキー順にそろえる)
+                    prev_keys = pd.Index(df_prev[key_col_name]); curr_keys = pd.Index(df_curr[key_col_name])
+                    retiree_candidates = df_prev[~df_prev[key_col_name].isin(curr_keys)].sort_values(key_col_name, kind='stable')
+                    new_hires = df_curr[~df_curr[key_col_name].isin(prev_keys)].sort_values(key_col_name, kind='stable')
+                    continuing_employees = pd.merge(df_prev, df_curr, on=key_col_name, how='inner', sort=True, suffixes=('_前期', '_当期'))
                     results['入社者候補'] = new_hires
                     
                     st.info("ステップ4.5/7: 在籍者の基本情報変更チェック...")
@@ -368,58 +612,71 @@ def main():
                         changed_birth_date = continuing_employees[bdate_prev].ne(continuing_employees[bdate_curr]) & ~(continuing_employees[bdate_prev].isna() & continuing_employees[bdate_curr].isna())
                         changed_hire_date = continuing_employees[hdate_prev].ne(continuing_employees[hdate_curr]) & ~(continuing_employees[hdate_prev].isna() & continuing_employees[hdate_curr].isna())
                         
-                        changed_df = continuing_employees[changed_birth_date | changed_hire_date].copy()
+                        changed_df = continuing_employees[changed_birth_date | changed_hire_date]
                         changed_df['エラー理由'] = '前期と当期で基本情報(生年月日 or 入社日)が不一致'
                         results['基本情報変更エラー'] = changed_df
                     else: st.warning("生年月日または入社年月日の列が揃っていないため、基本情報変更チェックはスキップされました。")
                     
                     if df_retire is not None:
                         st.info("ステップ4.8/7: 退職者データの照合...")
-                        merged_retire = pd.merge(retiree_candidates[[key_col_name]], df_retire, on=key_col_name, how='outer', indicator='retire_merge')
-                        results['退職者候補（退職者データ不突合）'] = retiree_candidates[retiree_candidates[key_col_name].isin(merged_retire[merged_retire['retire_merge'] == 'left_only'][key_col_name])]
-                        results['退職者データ過剰（前期末データ不突合）'] = df_retire[df_retire[key_col_name].isin(merged_retire[merged_retire['retire_merge'] == 'right_only'][key_col_name])]
-                        results['マッチした退職者'] = df_retire[df_retire[key_col_name].isin(merged_retire[merged_retire['retire_merge'] == 'both'][key_col_name])]
+                        # 結合せず、キーの所属判定だけで3区分に振り分ける
+                        candidate_keys = pd.Index(retiree_candidates[key_col_name]); retire_keys = pd.Index(df_retire[key_col_name])
+                        retire_in_candidates = df_retire[key_col_name].isin(candidate_keys)
+                        results['退職者候補（退職者データ不突合）'] = retiree_candidates[~retiree_candidates[key_col_name].isin(retire_keys)]
+                        results['退職者データ過剰（前期末データ不突合）'] = df_retire[~retire_in_candidates]
+                        results['マッチした退職者'] = df_retire[retire_in_candidates]
                     else: results['退職者候補'] = retiree_candidates
                     results['在籍者'] = continuing_employees
                     
                     st.info("ステップ5/7: 追加エラーチェック...")
+                    # 給与列は一括で数値の2次元配列に変換し、各チェックのマスクをNumPy上で計算してから行を抽出する
+                    salary_cols = [c for k in ("salary1", "salary2", "salary3", "salary4") for c in (f'{INTERNAL_COLS[k]}_前期', f'{INTERNAL_COLS[k]}_当期') if c in continuing_employees.columns]
+                    salary_values = continuing_employees[salary_cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                    def salary_arrays(cols):
+                        return [salary_values[:, salary_cols.index(c)] for c in cols]
+
                     sal1_int, sal2_int = INTERNAL_COLS["salary1"], INTERNAL_COLS["salary2"]
-                    required_salary1_cols = {f'{sal1_int}_前期', f'{sal1_int}_当期'}
-                    if required_salary1_cols.issubset(continuing_employees.columns):
-                        check_df_sal1 = continuing_employees.copy(); [check_df_sal1.update({col: pd.to_numeric(check_df_sal1[col], errors='coerce')}) for col in required_salary1_cols]; check_df_sal1.dropna(subset=required_salary1_cols, inplace=True)
-                        if check_salary_decrease_1: results['給与減額エラー(1)'] = check_df_sal1[check_df_sal1[f'{sal1_int}_当期'] < check_df_sal1[f'{sal1_int}_前期']]
+                    required_salary1_cols = [f'{sal1_int}_前期', f'{sal1_int}_当期']
+                    if set(required_salary1_cols).issubset(continuing_employees.columns):
+                        s1p, s1c = salary_arrays(required_salary1_cols); valid1 = ~(np.isnan(s1p) | np.isnan(s1c))
+                        if check_salary_decrease_1: results['給与減額エラー(1)'] = continuing_employees[valid1 & (s1c < s1p)]
                         if check_salary_increase_1:
-                            try: x1 = float(increase_rate_x1); results['給与増加率エラー(1)'] = check_df_sal1[check_df_sal1[f'{sal1_int}_当期'] >= check_df_sal1[f'{sal1_int}_前期'] * (1 + x1 / 100)]
+                            try: x1 = float(increase_rate_x1); results['給与増加率エラー(1)'] = continuing_employees[valid1 & (s1c >= s1p * (1 + x1 / 100))]
                             except ValueError: st.warning("給与増加率(x1)が無効な数値のためスキップしました。")
-                        required_salary2_cols = {f'{sal2_int}_前期', f'{sal2_int}_当期'}
-                        if not cumulative_checks_disabled_12 and required_salary2_cols.issubset(check_df_sal1.columns):
-                            check_df_sal2 = check_df_sal1.copy(); [check_df_sal2.update({col: pd.to_numeric(check_df_sal2[col], errors='coerce')}) for col in required_salary2_cols]; check_df_sal2.dropna(subset=required_salary2_cols, inplace=True)
-                            if check_cumulative_salary_1:
-                                try: y1 = int(months_y1); results['累計給与エラー(1-1)'] = check_df_sal2[check_df_sal2[f'{sal2_int}_当期'] < check_df_sal2[f'{sal2_int}_前期'] + check_df_sal2[f'{sal1_int}_前期'] * y1]
-                                except ValueError: st.warning("月数(y1)が無効な数値のためスキップしました。")
-                            if check_cumulative_salary_2:
-                                try: y1 = int(months_y1); z1 = float(allowance_rate_z1); upper_limit = (check_df_sal2[f'{sal2_int}_前期'] + check_df_sal2[f'{sal1_int}_前期'] * y1) * (1 + z1 / 100); results['累計給与エラー(1-2)'] = check_df_sal2[check_df_sal2[f'{sal2_int}_当期'] > upper_limit]
-                                except ValueError: st.warning("月数(y1)または許容率(z1)が無効な数値のためスキップしました。")
+                        required_salary2_cols = [f'{sal2_int}_前期', f'{sal2_int}_当期']
+                        if not cumulative_checks_disabled_12 and set(required_salary2_cols).issubset(continuing_employees.columns):
+                            s2p, s2c = salary_arrays(required_salary2_cols); valid2 = valid1 & ~(np.isnan(s2p) | np.isnan(s2c))
+                            if check_cumulative_salary_1 or check_cumulative_salary_2:
+                                # 「前期末累計 + 前期末給与 × 月数」は(1-1)と(1-2)で共通なので一度だけ計算する
+                                try: y1 = int(months_y1); expected_cum1 = s2p + s1p * y1
+                                except ValueError: expected_cum1 = None; st.warning("月数(y1)が無効な数値のためスキップしました。")
+                                if expected_cum1 is not None:
+                                    if check_cumulative_salary_1: results['累計給与エラー(1-1)'] = continuing_employees[valid2 & (s2c < expected_cum1)]
+                                    if check_cumulative_salary_2:
+                                        try: z1 = float(allowance_rate_z1); results['累計給与エラー(1-2)'] = continuing_employees[valid2 & (s2c > expected_cum1 * (1 + z1 / 100))]
+                                        except ValueError: st.warning("許容率(z1)が無効な数値のためスキップしました。")
                         elif not cumulative_checks_disabled_12: st.warning(f"「給与2」の列が指定/存在しないため、累計給与チェック(1)はスキップされました。")
                     else: st.warning(f"「給与1」の列が指定/存在しないため、給与1,2のチェックはスキップされました。")
 
                     sal3_int, sal4_int = INTERNAL_COLS["salary3"], INTERNAL_COLS["salary4"]
-                    required_salary3_cols = {f'{sal3_int}_前期', f'{sal3_int}_当期'}
-                    if required_salary3_cols.issubset(continuing_employees.columns):
-                        check_df_sal3 = continuing_employees.copy(); [check_df_sal3.update({col: pd.to_numeric(check_df_sal3[col], errors='coerce')}) for col in required_salary3_cols]; check_df_sal3.dropna(subset=required_salary3_cols, inplace=True)
-                        if check_salary_decrease_3: results['給与減額エラー(3)'] = check_df_sal3[check_df_sal3[f'{sal3_int}_当期'] < check_df_sal3[f'{sal3_int}_前期']]
+                    required_salary3_cols = [f'{sal3_int}_前期', f'{sal3_int}_当期']
+                    if set(required_salary3_cols).issubset(continuing_employees.columns):
+                        s3p, s3c = salary_arrays(required_salary3_cols); valid3 = ~(np.isnan(s3p) | np.isnan(s3c))
+                        if check_salary_decrease_3: results['給与減額エラー(3)'] = continuing_employees[valid3 & (s3c < s3p)]
                         if check_salary_increase_3:
-                            try: x3 = float(increase_rate_x3); results['給与増加率エラー(3)'] = check_df_sal3[check_df_sal3[f'{sal3_int}_当期'] >= check_df_sal3[f'{sal3_int}_前期'] * (1 + x3 / 100)]
+                            try: x3 = float(increase_rate_x3); results['給与増加率エラー(3)'] = continuing_employees[valid3 & (s3c >= s3p * (1 + x3 / 100))]
                             except ValueError: st.warning("給与増加率(x3)が無効な数値のためスキップしました。")
-                        required_salary4_cols = {f'{sal4_int}_前期', f'{sal4_int}_当期'}
-                        if not cumulative_checks_disabled_34 and required_salary4_cols.issubset(check_df_sal3.columns):
-                            check_df_sal4 = check_df_sal3.copy(); [check_df_sal4.update({col: pd.to_numeric(check_df_sal4[col], errors='coerce')}) for col in required_salary4_cols]; check_df_sal4.dropna(subset=required_salary4_cols, inplace=True)
-                            if check_cumulative_salary_3:
-                                try: y3 = int(months_y3); results['累計給与エラー(3-1)'] = check_df_sal4[check_df_sal4[f'{sal4_int}_当期'] < check_df_sal4[f'{sal4_int}_前期'] + check_df_sal4[f'{sal3_int}_前期'] * y3]
-                                except ValueError: st.warning("月数(y3)が無効な数値のためスキップしました。")
-                            if check_cumulative_salary_4:
-                                try: y3 = int(months_y3); z3 = float(allowance_rate_z3); upper_limit = (check_df_sal4[f'{sal4_int}_前期'] + check_df_sal4[f'{sal3_int}_前期'] * y3) * (1 + z3 / 100); results['累計給与エラー(3-2)'] = check_df_sal4[check_df_sal4[f'{sal4_int}_当期'] > upper_limit]
-                                except ValueError: st.warning("月数(y3)または許容率(z3)が無効な数値のためスキップしました。")
+                        required_salary4_cols = [f'{sal4_int}_前期', f'{sal4_int}_当期']
+                        if not cumulative_checks_disabled_34 and set(required_salary4_cols).issubset(continuing_employees.columns):
+                            s4p, s4c = salary_arrays(required_salary4_cols); valid4 = valid3 & ~(np.isnan(s4p) | np.isnan(s4c))
+                            if check_cumulative_salary_3 or check_cumulative_salary_4:
+                                try: y3 = int(months_y3); expected_cum3 = s4p + s3p * y3
+                                except ValueError: expected_cum3 = None; st.warning("月数(y3)が無効な数値のためスキップしました。")
+                                if expected_cum3 is not None:
+                                    if check_cumulative_salary_3: results['累計給与エラー(3-1)'] = continuing_employees[valid4 & (s4c < expected_cum3)]
+                                    if check_cumulative_salary_4:
+                                        try: z3 = float(allowance_rate_z3); results['累計給与エラー(3-2)'] = continuing_employees[valid4 & (s4c > expected_cum3 * (1 + z3 / 100))]
+                                        except ValueError: st.warning("許容率(z3)が無効な数値のためスキップしました。")
                         elif not cumulative_checks_disabled_34: st.warning(f"「給与4」の列が指定/存在しないため、累計給与チェック(3)はスキップされました。")
                     else: st.warning(f"「給与3」の列が指定/存在しないため、給与3,4のチェックはスキップされました。")
                     
@@ -450,86 +707,69 @@ def main():
                         summary_errors["退職者候補"] = len(results.get('退職者候補', []))
                     
                     st.session_state.summary_metrics = {**summary_info, **summary_errors}
-                    
+                    # 件数の集計が済んだので、Excel書き出しの前に読み込んだ元データと中間データの参照を外して解放する
+                    del df_prev, df_curr, df_retire, df_retire_read, df, dataframes, retiree_candidates, new_hires, continuing_employees, prev_keys, curr_keys
+
                     output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter', datetime_format='yyyy/mm/dd') as writer:
-                        summary_list = []
+                    # constant_memoryモードで行ごとにディスクへ書き出し、大きな結果シートでもメモリ使用量を抑える
+                    # (行順での書き込みが必要なため、列単位で書き込むto_excelは使わずwrite_dataframe_to_sheetで出力する)
+                    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}}) as writer:
+                        sheet_formats = create_sheet_formats(writer.book)
                         app_title = "退職給付債務計算のための従業員データチェッカー"
                         work_time = datetime.now(tz=ZoneInfo("Asia/Tokyo")).strftime('%Y年%m月%d日 %H:%M:%S JST')
-                        summary_list.extend([('アプリタイトル', app_title), ('アプリ最終更新日時', last_updated), ('作業日時', work_time), ('', '')])
-                        summary_list.extend([('--- アップロードファイル ---', ''), ('前期末従業員データ', file_prev.name), ('当期末従業員データ', file_curr.name)])
-                        if file_retire and retire_file_is_used: summary_list.append(('当期退職者データ', file_retire.name))
-                        summary_list.append(('', ''))
-                        summary_list.append(('--- ファイル設定 ---', ''))
-                        summary_list.append(('計算基準日', base_date.strftime('%Y/%m/%d')))
-                        summary_list.extend([('前期末ヘッダーキーワード1', keyword_prev_1), ('前期末ヘッダーキーワード2', keyword_prev_2)])
-                        summary_list.extend([('当期末ヘッダーキーワード1', keyword_curr_1), ('当期末ヘッダーキーワード2', keyword_curr_2)])
-                        if retire_file_is_used:
-                            summary_list.extend([('退職者ヘッダーキーワード1', keyword_retire_1), ('退職者ヘッダーキーワード2', keyword_retire_2)])
-                        summary_list.extend([('前期末データのシート名', sheet_prev), ('当期末データのシート名', sheet_curr)])
-                        if retire_file_is_used:
-                            summary_list.append(('退職者データのシート名', sheet_retire))
-                        summary_list.append(('', ''))
-                        summary_list.append(('--- 列名設定：前期末 ---', '')); summary_list.extend([('従業員番号', col_emp_id_prev), ('入社年月日', col_hire_date_prev), ('加入年月日', col_enroll_date_prev), ('生年月日', col_birth_date_prev), ('給与1', col_salary1_prev), ('給与2', col_salary2_prev), ('給与3', col_salary3_prev), ('給与4', col_salary4_prev)])
-                        summary_list.append(('--- 列名設定：当期末 ---', '')); summary_list.extend([('従業員番号', col_emp_id_curr), ('入社年月日', col_hire_date_curr), ('加入年月日', col_enroll_date_curr), ('生年月日', col_birth_date_curr), ('退職日', col_retire_date_curr), ('給与1', col_salary1_curr), ('給与2', col_salary2_curr), ('給与3', col_salary3_curr), ('給与4', col_salary4_curr)])
-                        if retire_file_is_used:
-                            summary_list.append(('--- 列名設定：退職者 ---', '')); summary_list.extend([('従業員番号', col_emp_id_retire), ('入社年月日', col_hire_date_retire), ('加入年月日', col_enroll_date_retire), ('生年月日', col_birth_date_retire), ('退職日', col_retire_date_retire)])
-                        summary_list.append(('', ''))
-                        summary_list.append(('--- 追加エラーチェック設定 (給与1,2) ---', '')); summary_list.extend([('給与減額チェック(1)', '有効' if check_salary_decrease_1 else '無効'), ('給与増加率チェック(1)', '有効' if check_salary_increase_1 else '無効')])
-                        if check_salary_increase_1: summary_list.append(('└ 増加率(x1)%', increase_rate_x1))
-                        summary_list.extend([('累計給与チェック(1-1)', '有効' if check_cumulative_salary_1 else '無効'), ('累計給与チェック(1-2)', '有効' if check_cumulative_salary_2 else '無効')])
-                        if check_cumulative_salary_1 or check_cumulative_salary_2: summary_list.extend([('└ 月数(y1)', months_y1), ('└ 許容率(z1)%', allowance_rate_z1)])
-                        summary_list.append(('', ''))
-                        summary_list.append(('--- 追加エラーチェック設定 (給与3,4) ---', '')); summary_list.extend([('給与減額チェック(3)', '有効' if check_salary_decrease_3 else '無効'), ('給与増加率チェック(3)', '有効' if check_salary_increase_3 else '無効')])
-                        if check_salary_increase_3: summary_list.append(('└ 増加率(x3)%', increase_rate_x3))
-                        summary_list.extend([('累計給与チェック(3-1)', '有効' if check_cumulative_salary_3 else '無効'), ('累計給与チェック(3-2)', '有効' if check_cumulative_salary_4 else '無効')])
-                        if check_cumulative_salary_3 or check_cumulative_salary_4: summary_list.extend([('└ 月数(y3)', months_y3), ('└ 許容率(z3)%', allowance_rate_z3)])
-                        summary_list.append(('', ''))
-                        
-                        summary_list.append(('--- チェック結果サマリー ---', ''))
-                        summary_order = [
-                            ('前期従業員データ数', '前期従業員データ数', '人'), ('当期従業員データ数', '当期従業員データ数', '人'),
-                            ('当期退職者データ数', '当期退職者データ数', '人'), ('キー重複', 'キー重複', '件'),
-                            ('基本情報変更エラー', '基本情報変更エラー', '件'), ('日付妥当性エラー', '日付妥当性エラー', '件'),
-                            ('在籍者数（凸合）', '在籍者数', '人'), 
-                            ('退職者候補（不凸合＝前期のみ）', '退職者候補（不突合）' if df_retire is not None else '退職者候補', '人'),
-                            ('入社者候補（不凸合＝当期のみ）', '入社者候補', '人'),
-                            ('退職者データ過剰（不凸合＝前期なし）', '退職者データ過剰', '人'),
-                            ('マッチした退職者（凸合）', 'マッチした退職者', '人'),
-                            ('給与減額エラー(1)', '給与減額エラー(1)', '件'), ('給与増加率エラー(1)', '給与増加率エラー(1)', '件'),
-                            ('累計給与エラー(1-1)', '累計給与エラー(1-1)', '件'), ('累計給与エラー(1-2)', '累計給与エラー(1-2)', '件'),
-                            ('給与減額エラー(3)', '給与減額エラー(3)', '件'), ('給与増加率エラー(3)', '給与増加率エラー(3)', '件'),
-                            ('累計給与エラー(3-1)', '累計給与エラー(3-1)', '件'), ('累計給与エラー(3-2)', '累計給与エラー(3-2)', '件')
+                        # サマリーの設定項目は条件付きの行も含めて1つのリストリテラルで組み立てる
+                        summary_list = [
+                            ('アプリタイトル', app_title), ('アプリ最終更新日時', last_updated), ('作業日時', work_time), ('', ''),
+                            ('--- アップロードファイル ---', ''), ('前期末従業員データ', file_prev.name), ('当期末従業員データ', file_curr.name),
+                            *([('当期退職者データ', file_retire.name)] if file_retire and retire_file_is_used else []),
+                            ('', ''),
+                            ('--- ファイル設定 ---', ''), ('計算基準日', base_date.strftime('%Y/%m/%d')),
+                            ('前期末ヘッダーキーワード1', keyword_prev_1), ('前期末ヘッダーキーワード2', keyword_prev_2),
+                            ('当期末ヘッダーキーワード1', keyword_curr_1), ('当期末ヘッダーキーワード2', keyword_curr_2),
+                            *([('退職者ヘッダーキーワード1', keyword_retire_1), ('退職者ヘッダーキーワード2', keyword_retire_2)] if retire_file_is_used else []),
+                            ('前期末データのシート名', sheet_prev), ('当期末データのシート名', sheet_curr),
+                            *([('退職者データのシート名', sheet_retire)] if retire_file_is_used else []),
+                            ('', ''),
+                            ('--- 列名設定：前期末 ---', ''), ('従業員番号', col_emp_id_prev), ('入社年月日', col_hire_date_prev), ('加入年月日', col_enroll_date_prev), ('生年月日', col_birth_date_prev), ('給与1', col_salary1_prev), ('給与2', col_salary2_prev), ('給与3', col_salary3_prev), ('給与4', col_salary4_prev),
+                            ('--- 列名設定：当期末 ---', ''), ('従業員番号', col_emp_id_curr), ('入社年月日', col_hire_date_curr), ('加入年月日', col_enroll_date_curr), ('生年月日', col_birth_date_curr), ('退職日', col_retire_date_curr), ('給与1', col_salary1_curr), ('給与2', col_salary2_curr), ('給与3', col_salary3_curr), ('給与4', col_salary4_curr),
+                            *([('--- 列名設定：退職者 ---', ''), ('従業員番号', col_emp_id_retire), ('入社年月日', col_hire_date_retire), ('加入年月日', col_enroll_date_retire), ('生年月日', col_birth_date_retire), ('退職日', col_retire_date_retire)] if retire_file_is_used else []),
+                            ('', ''),
+                            ('--- 追加エラーチェック設定 (給与1,2) ---', ''), ('給与減額チェック(1)', '有効' if check_salary_decrease_1 else '無効'), ('給与増加率チェック(1)', '有効' if check_salary_increase_1 else '無効'),
+                            *([('└ 増加率(x1)%', increase_rate_x1)] if check_salary_increase_1 else []),
+                            ('累計給与チェック(1-1)', '有効' if check_cumulative_salary_1 else '無効'), ('累計給与チェック(1-2)', '有効' if check_cumulative_salary_2 else '無効'),
+                            *([('└ 月数(y1)', months_y1), ('└ 許容率(z1)%', allowance_rate_z1)] if check_cumulative_salary_1 or check_cumulative_salary_2 else []),
+                            ('', ''),
+                            ('--- 追加エラーチェック設定 (給与3,4) ---', ''), ('給与減額チェック(3)', '有効' if check_salary_decrease_3 else '無効'), ('給与増加率チェック(3)', '有効' if check_salary_increase_3 else '無効'),
+                            *([('└ 増加率(x3)%', increase_rate_x3)] if check_salary_increase_3 else []),
+                            ('累計給与チェック(3-1)', '有効' if check_cumulative_salary_3 else '無効'), ('累計給与チェック(3-2)', '有効' if check_cumulative_salary_4 else '無効'),
+                            *([('└ 月数(y3)', months_y3), ('└ 許容率(z3)%', allowance_rate_z3)] if check_cumulative_salary_3 or check_cumulative_salary_4 else []),
+                            ('', ''),
+                            ('--- チェック結果サマリー ---', ''),
                         ]
-
-                        for label, key, unit in summary_order:
-                            value = st.session_state.summary_metrics.get(key)
-                            if value is not None:
-                                summary_list.append((label, f"{value} {unit}"))
+                        summary_metrics = st.session_state.summary_metrics
+                        summary_list.extend((label, f"{summary_metrics[key]} {unit}") for label, key, unit in SUMMARY_ORDER if summary_metrics.get(key) is not None)
                         
                         df_summary = pd.DataFrame(summary_list, columns=['項目', '設定・結果'])
-                        df_summary.to_excel(writer, sheet_name='サマリー', index=False)
+                        write_dataframe_to_sheet(writer, 'サマリー', df_summary, sheet_formats)
                         summary_worksheet = writer.sheets['サマリー']; summary_worksheet.set_column('A:A', 35); summary_worksheet.set_column('B:B', 30)
                         
-                        for sheet_name, df_result in results.items():
+                        # 書き込んだ結果は辞書から取り出して参照を外し、大きなシートの書き込み前に解放できるようにする
+                        for sheet_name in list(results):
+                            df_result = results.pop(sheet_name)
                             if not df_result.empty:
-                                df_to_write = df_result.copy()
-                                retiree_sheets = ['マッチした退職者', '退職者データ過剰（前期末データ不突合）']
-                                sheets_to_keep_all_cols = retiree_sheets + ['基本情報変更エラー']
+                                # 元データの行をそのまま出力するシートは、標準化した列(従業員番号・日付等)も残す
+                                source_row_sheets = ['マッチした退職者', '退職者データ過剰（前期末データ不突合）', '入社者候補', '退職者候補', '退職者候補（退職者データ不突合）']
+                                sheets_to_keep_all_cols = source_row_sheets + ['基本情報変更エラー']
                                 if sheet_name.startswith("日付妥当性エラー"): sheets_to_keep_all_cols.append(sheet_name)
                                 
-                                cols_to_drop = [c for c in ['_merge', 'retire_merge', key_col_name] if c in df_to_write.columns]
+                                cols_to_drop = [c for c in ['_merge', 'retire_merge', key_col_name] if c in df_result.columns]
                                 if sheet_name not in sheets_to_keep_all_cols:
-                                    internal_cols_to_drop = [c for c in INTERNAL_COLS.values() if c in df_to_write.columns]
+                                    internal_cols_to_drop = [c for c in INTERNAL_COLS.values() if c in df_result.columns]
                                     cols_to_drop.extend(internal_cols_to_drop)
-                                if cols_to_drop: df_to_write.drop(columns=cols_to_drop, inplace=True)
+                                # 結果のDataFrameは書き込み後に使わないため、コピーせず補助列を除いたものだけを作る
+                                df_to_write = df_result.drop(columns=cols_to_drop) if cols_to_drop else df_result
                                 
-                                df_to_write.to_excel(writer, sheet_name=sheet_name, index=False)
-                                worksheet = writer.sheets[sheet_name]
-                                date_col_width = 12
-                                for idx, col in enumerate(df_to_write.columns):
-                                    if pd.api.types.is_datetime64_any_dtype(df_to_write[col]):
-                                        worksheet.set_column(idx, idx, date_col_width)
+                                write_dataframe_to_sheet(writer, sheet_name, df_to_write, sheet_formats)
                     st.session_state.processed_data = output.getvalue()
                     st.info("ステップ7/7: 処理が完了しました。")
                     st.session_state.processing_complete = True
@@ -544,29 +784,7 @@ def main():
         st.header("📊 チェック結果サマリー")
         
         summary_df_list = []
-        summary_display_order = [
-            ('前期従業員データ数', '前期従業員データ数', '人'),
-            ('当期従業員データ数', '当期従業員データ数', '人'),
-            ('当期退職者データ数', '当期退職者データ数', '人'),
-            ('キー重複', 'キー重複', '件'),
-            ('基本情報変更エラー', '基本情報変更エラー', '件'),
-            ('日付妥当性エラー', '日付妥当性エラー', '件'),
-            ('在籍者数（凸合）', '在籍者数', '人'),
-            ('退職者候補（不凸合＝前期のみ）', '退職者候補（不突合）' if st.session_state.summary_metrics.get('退職者候補（不突合）') is not None else '退職者候補', '人'),
-            ('入社者候補（不凸合＝当期のみ）', '入社者候補', '人'),
-            ('退職者データ過剰（不凸合＝前期なし）', '退職者データ過剰', '人'),
-            ('マッチした退職者（凸合）', 'マッチした退職者', '人'),
-            ('給与減額エラー(1)', '給与減額エラー(1)', '件'),
-            ('給与増加率エラー(1)', '給与増加率エラー(1)', '件'),
-            ('累計給与エラー(1-1)', '累計給与エラー(1-1)', '件'),
-            ('累計給与エラー(1-2)', '累計給与エラー(1-2)', '件'),
-            ('給与減額エラー(3)', '給与減額エラー(3)', '件'),
-            ('給与増加率エラー(3)', '給与増加率エラー(3)', '件'),
-            ('累計給与エラー(3-1)', '累計給与エラー(3-1)', '件'),
-            ('累計給与エラー(3-2)', '累計給与エラー(3-2)', '件'),
-        ]
-
-        for label, key, unit in summary_display_order:
+        for label, key, unit in SUMMARY_ORDER:
             value = st.session_state.summary_metrics.get(key)
             if value is not None:
                 summary_df_list.append({"項目": label, "件数/人数": f"{value} {unit}"})
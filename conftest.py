@@ -0,0 +1 @@
+# リポジトリ直下の app.py をテストから import できるよう、pytest にルートを sys.path へ追加させる
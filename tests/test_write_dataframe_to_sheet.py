@@ -0,0 +1,55 @@
+import io
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from app import create_sheet_formats, write_dataframe_to_sheet
+
+
+def write_and_load(df):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}}) as writer:
+        write_dataframe_to_sheet(writer, 'テスト', df, create_sheet_formats(writer.book))
+    output.seek(0)
+    return load_workbook(output)['テスト']
+
+
+def test_mixed_type_date_column_keeps_date_format():
+    df = pd.DataFrame({'備考日': [datetime(2020, 1, 1), '不明', None]})
+    df['役職'] = pd.Series(['課長', '課長', '部長'], dtype='category')
+    ws = write_and_load(df)
+
+    assert ws['A2'].is_date and ws['A2'].number_format == 'yyyy/mm/dd'
+    assert ws['A2'].value == datetime(2020, 1, 1)
+    assert ws['A3'].value == '不明' and not ws['A3'].is_date
+    assert ws['A4'].value is None
+
+
+def test_categorical_date_column_keeps_date_format():
+    df = pd.DataFrame({'入社日': pd.Series([pd.Timestamp('2021-04-01'), '不明'], dtype='category')})
+    ws = write_and_load(df)
+
+    assert ws['A2'].is_date and ws['A2'].number_format == 'yyyy/mm/dd'
+
+
+def test_datetime64_column_keeps_date_format():
+    df = pd.DataFrame({'生年月日': pd.to_datetime(['1980-05-06', None])})
+    ws = write_and_load(df)
+
+    assert ws['A2'].is_date and ws['A2'].number_format == 'yyyy/mm/dd'
+    assert ws['A3'].value is None
+
+
+def test_date_values_formatted_on_every_sheet_without_workbook_default():
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}}) as writer:
+        formats = create_sheet_formats(writer.book)
+        write_dataframe_to_sheet(writer, 'サマリー', pd.DataFrame({'項目': ['作業日時'], '設定・結果': ['-']}), formats)
+        write_dataframe_to_sheet(writer, '在籍者', pd.DataFrame({'日付': [date(2022, 3, 31), pd.Timestamp('2023-03-31'), 'なし']}), formats)
+    output.seek(0)
+    ws = load_workbook(output)['在籍者']
+
+    assert ws['A2'].is_date and ws['A2'].number_format == 'yyyy/mm/dd'
+    assert ws['A3'].is_date and ws['A3'].number_format == 'yyyy/mm/dd'
+    assert not ws['A4'].is_date